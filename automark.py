@@ -1,4 +1,5 @@
-import marker
+import ffengine
+import imagemark
 import minparser as argp
 from os import walk
 import magic
@@ -9,13 +10,36 @@ argp.app_description = "Add watermark to video one by one or in bulk"
 argp.app_footer_description = "Have fun :P"
 
 
+def _window():
+    start = argp.get_param('start', "")
+    end = argp.get_param('end', "")
+    return {
+        'start': float(start) if len(start) else None,
+        'end': float(end) if len(end) else None,
+        'smart': argp.is_option_set('smart'),
+    }
+
+
 def single():
     videos = argp.get_param_arr('v')
     logo = argp.get_param('l')
     output_dir = argp.get_param('out_dir', "")
     for vid in videos:
-        marker.add_watermark(vid, logo, output_dir if len(output_dir) else None)
+        ffengine.add_watermark_sync(vid, logo, output_dir if len(output_dir) else None, **_window())
+
+
+
+def images():
+    image_files = argp.get_param_arr('i')
+    logo = argp.get_param('l')
+    output_dir = argp.get_param('out_dir', "")
+    _mark_images(image_files, logo, output_dir if len(output_dir) else None)
+
 
+def _mark_images(image_files, logo, output_dir):
+    for result in imagemark.add_watermark_images(image_files, logo, output_dir):
+        if result.error:
+            print("%s: %s" % (result.input_path, result.error))
 
 
 def bulk():
@@ -30,10 +54,13 @@ def bulk():
     filenames = next(walk(directory), (None, None, []))[2]
     for fname in filenames:
         if mime.from_file(directory + fname).startswith('video'):
-            marker.add_watermark(directory + fname, logo, output_dir if len(output_dir) else None)
+            ffengine.add_watermark_sync(directory + fname, logo, output_dir if len(output_dir) else None, **_window())
     
 
 
-argp.add_command("single", "mark single file", single)
-argp.add_command("bulk", "mark all files in folder", bulk)
-argp.run()
\ No newline at end of file
+# guarded so process pool workers importing this module don't re-run the CLI
+if __name__ == "__main__":
+    argp.add_command("single", "mark single file", single)
+    argp.add_command("images", "mark image files in one batch", images)
+    argp.add_command("bulk", "mark all files in folder", bulk)
+    argp.run()
\ No newline at end of file
@@ -2,24 +2,28 @@ from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File
 from fastapi.responses import FileResponse
 from pathlib import Path
 import shutil
-from concurrent.futures import ThreadPoolExecutor
-import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import logging
 import traceback
 
 from ..models.schemas import JobCreate, JobStatus
 from ..services.jobs import create_job, get_job, list_jobs, update_job_status, _jobs
 from ..core.config import settings
-from ..services.watermark import process_job
+from ..services.watermark import process_job_async, submit_image_jobs, _load_ffengine, _load_marker
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
-# Thread pool for parallel video processing (ffmpeg releases GIL, so threads work well)
-# Use a conservative number of workers (roughly half of CPUs, capped)
-MAX_WORKERS = min(4, max(1, (os.cpu_count() or 2) // 2))
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# All ffmpeg children are supervised from one engine event loop thread;
+# concurrency is bounded by a semaphore rather than one blocked thread per job.
+engine = _load_ffengine().FFmpegEngine(max_concurrency=settings.ffmpeg_max_concurrency)
+
+# Long-lived pool for image batches so each worker keeps its decoded logo cached.
+# Spawn rather than fork: the API process already runs the engine loop and
+# server threads, and forking would copy their held locks into the workers.
+image_pool = ProcessPoolExecutor(max_workers=settings.image_workers, mp_context=multiprocessing.get_context("spawn"))
 
 
 @router.get("/health")
@@ -34,9 +38,17 @@ def reset_jobs():
     return {"status": "reset"}
 
 
+def _check_window(start: float | None, end: float | None) -> None:
+    try:
+        _load_marker().validate_window(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid watermark window: {e}")
+
+
 @router.post("/jobs", response_model=JobStatus)
 def create_job_endpoint(payload: JobCreate):
-    job = create_job(payload.input_name, payload.logo_name, payload.input_name, payload.logo_name)
+    _check_window(payload.start, payload.end)
+    job = create_job(payload.input_name, payload.logo_name, payload.input_name, payload.logo_name, start=payload.start, end=payload.end, smart=payload.smart)
     return JobStatus(
         id=job.id,
         status=job.status,
@@ -60,6 +72,8 @@ def list_jobs_endpoint():
                 scale=j.scale,
                 progress=j.progress,
                 file_size=j.file_size,
+                start=j.start,
+                end=j.end,
             )
             for j in list_jobs()
         ]
@@ -95,6 +109,8 @@ def get_job_endpoint(job_id: str):
             scale=job.scale,
             progress=job.progress,
             file_size=job.file_size,
+            start=job.start,
+            end=job.end,
         )
     except HTTPException:
         raise
@@ -110,7 +126,11 @@ def upload_and_create_jobs(
     logo: UploadFile = File(...),
     position: str = "bottom-right",
     scale: float = 0.2,
+    start: float | None = None,
+    end: float | None = None,
+    smart: bool = False,
 ):
+    _check_window(start, end)
     try:
         base_dir = Path(settings.storage_dir)
         input_dir = base_dir / "inputs"
@@ -134,10 +154,17 @@ def upload_and_create_jobs(
             # Get file size after writing
             file_size = video_path.stat().st_size
 
-            job = create_job(video.filename, logo.filename, str(video_path), str(logo_path), position, scale, file_size)
+            job = create_job(video.filename, logo.filename, str(video_path), str(logo_path), position, scale, file_size, start, end, smart)
             update_job_status(job.id, "queued")
-            # Submit to thread pool for parallel processing (multiple videos at once)
-            executor.submit(process_job, job.id, str(output_dir))
+            # Submit to the ffmpeg engine (multiple videos at once)
+            engine.submit(
+                lambda job_id=job.id: process_job_async(
+                    job_id,
+                    str(output_dir),
+                    timeout=settings.ffmpeg_timeout,
+                    stall_timeout=settings.ffmpeg_stall_timeout,
+                )
+            )
 
             job_statuses.append(
                 JobStatus(
@@ -150,6 +177,8 @@ def upload_and_create_jobs(
                     output_name=job.output_name,
                     progress=job.progress,
                     file_size=job.file_size,
+                    start=job.start,
+                    end=job.end,
                 )
             )
 
@@ -171,3 +200,58 @@ def download_job_output(job_id: str):
     except Exception as e:
         logger.error("Error in download_job_output: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/jobs/upload-images", response_model=list[JobStatus])
+def upload_and_create_image_jobs(
+    images: list[UploadFile] = File(...),
+    logo: UploadFile = File(...),
+    position: str = "bottom-right",
+    scale: float = 0.2,
+):
+    try:
+        base_dir = Path(settings.storage_dir)
+        input_dir = base_dir / "inputs"
+        logo_dir = base_dir / "logos"
+        output_dir = base_dir / "outputs"
+
+        input_dir.mkdir(parents=True, exist_ok=True)
+        logo_dir.mkdir(parents=True, exist_ok=True)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        logo_path = logo_dir / logo.filename
+        with logo_path.open("wb") as buffer:
+            shutil.copyfileobj(logo.file, buffer)
+
+        job_statuses: list[JobStatus] = []
+        job_ids: list[str] = []
+        for image in images:
+            image_path = input_dir / image.filename
+            with image_path.open("wb") as buffer:
+                shutil.copyfileobj(image.file, buffer)
+
+            file_size = image_path.stat().st_size
+
+            job = create_job(image.filename, logo.filename, str(image_path), str(logo_path), position, scale, file_size)
+            job_ids.append(job.id)
+            job_statuses.append(
+                JobStatus(
+                    id=job.id,
+                    status=job.status,
+                    input_name=job.input_name,
+                    logo_name=job.logo_name,
+                    position=job.position,
+                    scale=job.scale,
+                    output_name=job.output_name,
+                    progress=job.progress,
+                    file_size=job.file_size,
+                )
+            )
+
+        # The whole upload is one batch across the image process pool; the
+        # jobs are finished from the pool's callbacks, so no request thread waits on it
+        submit_image_jobs(job_ids, str(output_dir), image_pool)
+        return job_statuses
+    except Exception as e:
+        logger.error("Error in upload_and_create_image_jobs: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,4 +1,23 @@
 from pydantic import BaseModel
+import os
+
+
+def _env_int(name: str, default: int | None) -> int | None:
+    """Positive int from the environment; unset or invalid keeps `default`, 0 means None."""
+    try:
+        value = int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+    return value if value > 0 else None
+
+
+def _env_seconds(name: str, default: float | None) -> float | None:
+    """Seconds from the environment; unset or invalid keeps `default`, 0 disables (None)."""
+    try:
+        value = float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+    return value if value > 0 else None
 
 
 class Settings(BaseModel):
@@ -6,6 +25,15 @@ class Settings(BaseModel):
     api_prefix: str = "/api"
     allow_origins: list[str] = ["*"]
     storage_dir: str = "storage"
+    # ffmpeg engine: concurrent encodes, and per-job limits in seconds (None disables).
+    # Each encode already uses several threads (FFMPEG_THREADS), so the default stays
+    # conservative (roughly half of CPUs, capped). For dozens of short encodes per node,
+    # raise FFMPEG_MAX_CONCURRENCY together with a low FFMPEG_THREADS.
+    ffmpeg_max_concurrency: int = _env_int("FFMPEG_MAX_CONCURRENCY", None) or min(4, max(1, (os.cpu_count() or 2) // 2))
+    ffmpeg_timeout: float | None = _env_seconds("FFMPEG_TIMEOUT", 3600)
+    ffmpeg_stall_timeout: float | None = _env_seconds("FFMPEG_STALL_TIMEOUT", 120)
+    # worker processes for the in-process image pipeline (IMAGE_WORKERS, None = one per CPU)
+    image_workers: int | None = _env_int("IMAGE_WORKERS", None)
 
 
 settings = Settings()
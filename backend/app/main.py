@@ -6,7 +6,7 @@ from pathlib import Path
 import traceback
 
 from .core.config import settings
-from .api.routes import router
+from .api.routes import router, engine, image_pool
 
 app = FastAPI(title=settings.app_name)
 
@@ -39,4 +39,11 @@ async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
 
+@app.on_event("shutdown")
+def shutdown_workers():
+    # Terminate any ffmpeg children and image workers still running
+    engine.shutdown()
+    image_pool.shutdown(cancel_futures=True)
+
+
 app.include_router(router, prefix=settings.api_prefix)
@@ -7,6 +7,9 @@ class JobCreate(BaseModel):
     logo_name: str = Field(..., min_length=1)
     position: Literal["top-left", "top-right", "bottom-left", "bottom-right", "full"] = "bottom-right"
     scale: float = 0.2
+    start: Optional[float] = Field(None, ge=0)
+    end: Optional[float] = Field(None, gt=0)
+    smart: bool = False
 
 
 class JobStatus(BaseModel):
@@ -19,3 +22,5 @@ class JobStatus(BaseModel):
     scale: float = 0.2
     progress: int = 0  # 0-100 percentage
     file_size: Optional[int] = None  # file size in bytes
+    start: Optional[float] = None  # watermark window start (seconds)
+    end: Optional[float] = None  # watermark window end (seconds)
@@ -18,12 +18,15 @@ class Job:
     scale: float = 0.2
     progress: int = 0  # 0-100 percentage
     file_size: int | None = None  # file size in bytes
+    start: float | None = None  # watermark window start (seconds)
+    end: float | None = None  # watermark window end (seconds)
+    smart: bool = False  # re-encode only the GOPs overlapping the window
 
 
 _jobs: Dict[str, Job] = {}
 
 
-def create_job(input_name: str, logo_name: str, input_path: str, logo_path: str, position: str = "bottom-right", scale: float = 0.2, file_size: int | None = None) -> Job:
+def create_job(input_name: str, logo_name: str, input_path: str, logo_path: str, position: str = "bottom-right", scale: float = 0.2, file_size: int | None = None, start: float | None = None, end: float | None = None, smart: bool = False) -> Job:
     job_id = str(uuid.uuid4())
     job = Job(
         id=job_id,
@@ -35,6 +38,9 @@ def create_job(input_name: str, logo_name: str, input_path: str, logo_path: str,
         position=position,
         scale=scale,
         file_size=file_size,
+        start=start,
+        end=end,
+        smart=smart,
     )
     _jobs[job_id] = job
     return job
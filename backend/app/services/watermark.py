@@ -1,5 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
+import asyncio
 import sys
 import logging
 from datetime import datetime
@@ -31,7 +32,24 @@ def _load_marker():
     return marker
 
 
-def process_job(job_id: str, output_dir: str) -> None:
+def _load_imagemark():
+    _load_marker()
+    import imagemark  # type: ignore
+    return imagemark
+
+
+def _load_ffengine():
+    _load_marker()
+    import ffengine  # type: ignore
+    return ffengine
+
+
+async def process_job_async(job_id: str, output_dir: str, timeout: float | None = None, stall_timeout: float | None = None) -> None:
+    """Run a video job through `ffengine` on the engine's event loop.
+
+    ffmpeg runs as an asyncio child instead of blocking a pool thread, and
+    the job's progress follows ffmpeg's own progress reports (10-90%).
+    """
     job = get_job(job_id)
     if not job:
         msg = f"Job {job_id} not found"
@@ -41,43 +59,90 @@ def process_job(job_id: str, output_dir: str) -> None:
 
     log_to_file(f"Starting job {job_id}: {job.input_path} with {job.logo_path}")
     logger.info(f"Starting watermark job {job_id}: {job.input_path} with {job.logo_path}")
-    update_job_status(job_id, "processing", progress=0)
-    
+    update_job_status(job_id, "processing", progress=10)
+
+    def on_progress(percent: int) -> None:
+        update_job_status(job_id, "processing", progress=10 + percent * 80 // 100)
+
     try:
-        marker = _load_marker()
-        log_to_file(f"Job {job_id}: Loading video {job.input_path}")
-        logger.info(f"Processing video: {job.input_path}")
-        update_job_status(job_id, "processing", progress=10)
-        
-        # Pass position and scale parameters to watermarking
-        output_path = marker.add_watermark(
-            job.input_path, 
-            job.logo_path, 
+        ffengine = _load_ffengine()
+        output_path = await ffengine.add_watermark(
+            job.input_path,
+            job.logo_path,
             output_dir,
             position=job.position,
-            scale=job.scale
+            scale=job.scale,
+            start=job.start,
+            end=job.end,
+            smart=job.smart,
+            timeout=timeout,
+            stall_timeout=stall_timeout,
+            on_progress=on_progress,
         )
-        log_to_file(f"Job {job_id}: Watermark applied, progress to 90%")
         update_job_status(job_id, "processing", progress=90)
-        logger.info(f"Watermark completed, output: {output_path}")
-        
+
         if not output_path or not Path(output_path).exists():
             msg = f"Output file not found: {output_path}"
             log_to_file(f"ERROR Job {job_id}: {msg}")
             logger.error(msg)
             update_job_status(job_id, "failed", progress=0)
             return
-            
+
         output_name = Path(output_path).name
         log_to_file(f"Job {job_id}: COMPLETED - Output: {output_name}")
         logger.info(f"Job {job_id} completed successfully")
         update_job_status(job_id, "completed", output_name=output_name, output_path=output_path, progress=100)
+    except asyncio.CancelledError:
+        log_to_file(f"Job {job_id}: cancelled")
+        update_job_status(job_id, "failed", progress=0)
+        raise
     except Exception as e:
         msg = f"Job {job_id} failed: {str(e)}"
         log_to_file(f"ERROR: {msg}")
         logger.error(msg, exc_info=True)
-        import traceback
-        tb = traceback.format_exc()
-        log_to_file(tb)
         update_job_status(job_id, "failed", progress=0)
 
+
+def submit_image_jobs(job_ids: list[str], output_dir: str, executor) -> None:
+    """Submit a batch of image jobs to `executor` through `imagemark` and return.
+
+    All jobs in a batch come from one upload, so they share logo, position
+    and scale. Nothing waits on the batch: each job is completed or failed
+    from the executor's callback thread as its chunk finishes.
+    """
+    jobs = [job for job in (get_job(job_id) for job_id in job_ids) if job]
+    if not jobs:
+        return
+    first = jobs[0]
+    log_to_file(f"Starting image batch of {len(jobs)} with {first.logo_path}")
+    for job in jobs:
+        update_job_status(job.id, "processing", progress=10)
+
+    def on_result(index: int, result) -> None:
+        job = jobs[index]
+        if result.error or not result.output_path:
+            log_to_file(f"ERROR Job {job.id}: {result.error}")
+            logger.error(f"Job {job.id} failed: {result.error}")
+            update_job_status(job.id, "failed", progress=0)
+            return
+        output_name = Path(result.output_path).name
+        log_to_file(f"Job {job.id}: COMPLETED - Output: {output_name}")
+        update_job_status(job.id, "completed", output_name=output_name, output_path=result.output_path, progress=100)
+
+    try:
+        imagemark = _load_imagemark()
+        imagemark.submit_watermark_images(
+            [job.input_path for job in jobs],
+            first.logo_path,
+            output_dir,
+            position=first.position,
+            scale=first.scale,
+            executor=executor,
+            on_result=on_result,
+        )
+    except Exception as e:
+        msg = f"Image batch failed: {str(e)}"
+        log_to_file(f"ERROR: {msg}")
+        logger.error(msg, exc_info=True)
+        for job in jobs:
+            update_job_status(job.id, "failed", progress=0)
@@ -0,0 +1,329 @@
+"""Asyncio execution engine for ffmpeg jobs.
+
+`marker.add_watermark` blocks a whole thread in `subprocess.run` for the
+lifetime of each encode and buffers all of ffmpeg's stderr in memory. This
+module supervises ffmpeg children from a single event loop instead:
+
+- children are started with `asyncio.create_subprocess_exec`;
+- progress is read from `-progress pipe:1` on stdout as it is produced;
+- stderr is streamed and only the last `stderr_lines` lines are kept;
+- each run enforces an overall timeout and a stall timeout (no progress
+  reported for that many seconds), terminating the child on either;
+- cancelling a run terminates its child (SIGTERM, then SIGKILL after a
+  grace period).
+
+`FFmpegEngine` bounds concurrency with a semaphore and can own a background
+event loop thread so synchronous code (the FastAPI route handlers) can
+submit jobs. `add_watermark_sync` is the blocking wrapper used by the CLI.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+
+import marker
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[float], None]
+
+# Seconds between SIGTERM and SIGKILL when stopping a child.
+TERMINATE_GRACE = 5.0
+
+
+class FFmpegError(RuntimeError):
+    """ffmpeg exited with a non-zero status."""
+
+    def __init__(self, message: str, returncode: Optional[int] = None, stderr_tail: str = ""):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+
+
+class FFmpegTimeout(FFmpegError):
+    """ffmpeg ran longer than the allowed timeout."""
+
+
+class FFmpegStalled(FFmpegError):
+    """ffmpeg stopped reporting progress for longer than the stall timeout."""
+
+
+@dataclass
+class FFmpegResult:
+    returncode: int
+    elapsed: float
+    stderr_tail: str
+
+
+def _with_progress_args(cmd: list[str]) -> list[str]:
+    # Options placed right after the binary are global options.
+    return [cmd[0], "-nostats", "-progress", "pipe:1", *cmd[1:]]
+
+
+async def _read_progress(stream: asyncio.StreamReader, on_line: Callable[[str, str], None]) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        key, sep, value = line.decode(errors="ignore").strip().partition("=")
+        if sep:
+            on_line(key, value)
+
+
+async def _read_stderr(stream: asyncio.StreamReader, tail: collections.deque) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        tail.append(line.decode(errors="ignore").rstrip())
+
+
+async def _terminate(proc: asyncio.subprocess.Process, grace: float = TERMINATE_GRACE) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), timeout=grace)
+    except ProcessLookupError:
+        return
+    except asyncio.TimeoutError:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            return
+        await proc.wait()
+
+
+async def run_ffmpeg(
+    cmd: list[str],
+    *,
+    timeout: Optional[float] = None,
+    stall_timeout: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    stderr_lines: int = 50,
+) -> FFmpegResult:
+    """Run an ffmpeg command under supervision and return its result.
+
+    - `timeout` caps total wall time in seconds.
+    - `stall_timeout` fails the run if ffmpeg reports no progress for that long.
+    - `on_progress` is called with the processed output time in seconds.
+    - `stderr_lines` bounds how much stderr is kept for error messages.
+
+    Raises `FFmpegError` (or `FFmpegTimeout` / `FFmpegStalled`) on failure.
+    """
+    tail: collections.deque = collections.deque(maxlen=stderr_lines)
+    start = time.monotonic()
+    last_activity = start
+    deadline = start + timeout if timeout is not None else None
+
+    def on_line(key: str, value: str) -> None:
+        nonlocal last_activity
+        last_activity = time.monotonic()
+        # out_time_ms is in microseconds despite its name; prefer out_time_us when present
+        if key in ("out_time_us", "out_time_ms") and on_progress is not None:
+            try:
+                on_progress(max(0, int(value)) / 1_000_000)
+            except ValueError:
+                pass
+
+    proc = await asyncio.create_subprocess_exec(
+        *_with_progress_args(cmd),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    readers = [
+        asyncio.ensure_future(_read_progress(proc.stdout, on_line)),
+        asyncio.ensure_future(_read_stderr(proc.stderr, tail)),
+    ]
+    waiter = asyncio.ensure_future(proc.wait())
+
+    try:
+        while not waiter.done():
+            # wake up at least once a second, and right at the deadline
+            poll = 1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic()))
+            await asyncio.wait({waiter}, timeout=poll)
+            if waiter.done():
+                break
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                await _terminate(proc)
+                raise FFmpegTimeout(f"ffmpeg timed out after {timeout:g}s", proc.returncode, "\n".join(tail))
+            if stall_timeout is not None and now - last_activity > stall_timeout:
+                await _terminate(proc)
+                raise FFmpegStalled(f"ffmpeg made no progress for {stall_timeout:g}s", proc.returncode, "\n".join(tail))
+        await asyncio.gather(*readers)
+    except BaseException:
+        # Covers cancellation too: never leave an orphaned child behind.
+        await asyncio.shield(_terminate(proc))
+        for task in (*readers, waiter):
+            task.cancel()
+        await asyncio.gather(*readers, waiter, return_exceptions=True)
+        raise
+
+    stderr_tail = "\n".join(tail)
+    if proc.returncode != 0:
+        raise FFmpegError(f"ffmpeg failed: {stderr_tail}", proc.returncode, stderr_tail)
+    return FFmpegResult(returncode=proc.returncode, elapsed=time.monotonic() - start, stderr_tail=stderr_tail)
+
+
+async def add_watermark(
+    video_filepath: str,
+    logo_filepath: str,
+    output_dir: Optional[str] = None,
+    position: str = "bottom-right",
+    scale: float = 0.2,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    smart: bool = False,
+    *,
+    timeout: Optional[float] = None,
+    stall_timeout: Optional[float] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> str:
+    """Async counterpart of `marker.add_watermark`.
+
+    `timeout` covers the whole job: every step of the plan, and the full
+    re-encode if a smart render has to fall back. `on_progress` receives a
+    0-100 percentage of the re-encoding step when its duration is known.
+    A failed, timed out or cancelled job leaves no partial output behind.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def plan_for(smart: bool) -> Awaitable[marker.RenderPlan]:
+        # ffprobe and the logo cache are short blocking calls; keep them off the loop.
+        return loop.run_in_executor(
+            None,
+            lambda: marker.build_render_plan(
+                video_filepath, logo_filepath, output_dir, position=position, scale=scale, start=start, end=end, smart=smart
+            ),
+        )
+
+    plan = await plan_for(smart)
+    try:
+        await _run_plan(plan, timeout, deadline, stall_timeout, on_progress)
+    except FFmpegTimeout:
+        raise
+    except FFmpegError as e:
+        if not plan.smart:
+            raise
+        # partial re-encode failed (or didn't verify): redo the whole file
+        logger.warning("smart render failed, falling back to a full re-encode: %s", e)
+        plan = await plan_for(False)
+        await _run_plan(plan, timeout, deadline, stall_timeout, on_progress)
+    return plan.out_path
+
+
+async def _run_plan(
+    plan: marker.RenderPlan,
+    timeout: Optional[float],
+    deadline: Optional[float],
+    stall_timeout: Optional[float],
+    on_progress: Optional[Callable[[int], None]],
+) -> None:
+    """Run the plan's steps, each with whatever is left of the job's `timeout` until `deadline`."""
+    duration = plan.encode_duration
+
+    def report(seconds: float) -> None:
+        if on_progress is not None and duration:
+            on_progress(min(100, int(seconds * 100 / duration)))
+
+    try:
+        for i, cmd in enumerate(plan.steps):
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                raise FFmpegTimeout(f"ffmpeg timed out after {timeout:g}s")
+            try:
+                await run_ffmpeg(
+                    cmd,
+                    timeout=remaining,
+                    stall_timeout=stall_timeout,
+                    on_progress=report if i == plan.encode_step else None,
+                )
+            except FFmpegTimeout as e:
+                # report the job's limit, not what was left of it for this step
+                marker.log_ffmpeg_error(cmd, e.stderr_tail or str(e))
+                raise FFmpegTimeout(f"ffmpeg timed out after {timeout:g}s", e.returncode, e.stderr_tail) from e
+            except FFmpegError as e:
+                marker.log_ffmpeg_error(cmd, e.stderr_tail or str(e))
+                raise
+    except BaseException:
+        # failed, timed out or cancelled: don't leave a truncated output behind
+        Path(plan.out_path).unlink(missing_ok=True)
+        raise
+    finally:
+        plan.cleanup()
+
+
+def add_watermark_sync(*args: Any, **kwargs: Any) -> str:
+    """Blocking wrapper around `add_watermark` for the CLI."""
+    return asyncio.run(add_watermark(*args, **kwargs))
+
+
+class FFmpegEngine:
+    """Runs ffmpeg jobs on one event loop with bounded concurrency.
+
+    Use `run` from async code that already owns a loop. Use `submit` from
+    synchronous code: the engine starts a daemon thread with its own loop on
+    first use and returns a `concurrent.futures.Future`; cancelling that
+    future terminates the ffmpeg child.
+    """
+
+    def __init__(self, max_concurrency: int = 16):
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `job()` once a concurrency slot is free."""
+        async with self._get_semaphore():
+            return await job()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="ffmpeg-engine", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, job: Callable[[], Coroutine[Any, Any, Any]]) -> concurrent.futures.Future:
+        """Schedule `job()` on the engine loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(self.run(job), self._ensure_loop())
+
+    def shutdown(self) -> None:
+        """Cancel outstanding jobs (terminating their children) and stop the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def _cancel_all() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join()
+        loop.close()
+        self._semaphore = None
@@ -6,18 +6,33 @@ logo scale based on the actual video size and runs ffmpeg with a
 filter_complex that resizes/crops the video to 1080x1920 and overlays
 the scaled logo at the requested corner with padding.
 
+The logo can be limited to a time window (`start` / `end`). In smart mode
+only the GOPs overlapping that window are re-encoded; the keyframe-aligned
+parts before and after it are stream-copied and concatenated back.
+
 Requirements: `ffmpeg` and `ffprobe` must be available on PATH.
 """
 from __future__ import annotations
 
+from dataclasses import dataclass
 from pathlib import Path
+import json
+import logging
 import shutil
 import subprocess
 import os
 import shlex
+import tempfile
 from typing import Optional
 
 
+logger = logging.getLogger(__name__)
+
+# Logo padding from the frame edges, in pixels
+PADDING_X = 15
+PADDING_Y = 55  # leave extra space for controls at bottom
+
+
 def _which(cmd: str) -> Optional[str]:
     return shutil.which(cmd)
 
@@ -51,18 +66,85 @@ def get_output_filepath(input_filepath: str, output_dir: Optional[str] = None) -
     return str(base.with_name(out_name))
 
 
-def add_watermark(video_filepath: str, logo_filepath: str, output_dir: Optional[str] = None, position: str = "bottom-right", scale: float = 0.2) -> str:
-    """Add watermark using ffmpeg and return the output filepath.
+def _ffprobe_duration(path: str) -> Optional[float]:
+    """Return the container duration in seconds using ffprobe, or None if unknown."""
+    ffprobe = _which("ffprobe")
+    if not ffprobe:
+        return None
+    cmd = [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path]
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        return None
+    try:
+        return float(res.stdout.strip())
+    except ValueError:
+        return None
 
-    - `scale` is relative to video height (e.g. 0.2 means logo height = 20% of video height).
-    - `position` one of top-left, top-right, bottom-left, bottom-right, full.
+
+def log_ffmpeg_error(cmd: list[str], err: str) -> None:
+    """Append a failed ffmpeg invocation and its stderr to storage/errors.log."""
+    try:
+        errfile = Path(os.environ.get("STORAGE_DIR", "storage")) / "errors.log"
+        errfile.parent.mkdir(parents=True, exist_ok=True)
+        with errfile.open("a", encoding="utf-8") as f:
+            f.write("--- ffmpeg error ---\n")
+            f.write(f"cmd: {shlex.join(cmd)}\n")
+            f.write(err + "\n")
+    except Exception:
+        pass
+
+
+def validate_window(start: Optional[float], end: Optional[float]) -> None:
+    """Raise ValueError unless [start, end] is a usable watermark window."""
+    if start is not None and start < 0:
+        raise ValueError("start must be >= 0")
+    if end is not None and end <= 0:
+        raise ValueError("end must be > 0")
+    if start is not None and end is not None and end <= start:
+        raise ValueError("end must be greater than start")
+
+
+def _enable_expr(start: Optional[float], end: Optional[float]) -> Optional[str]:
+    """ffmpeg timeline expression showing the logo only inside [start, end]."""
+    if start is None and end is None:
+        return None
+    if end is None:
+        return f"gte(t,{start})"
+    if start is None:
+        return f"lte(t,{end})"
+    return f"between(t,{start},{end})"
+
+
+def build_watermark_command(
+    video_filepath: str,
+    logo_filepath: str,
+    output_dir: Optional[str] = None,
+    position: str = "bottom-right",
+    scale: float = 0.2,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    out_path: Optional[str] = None,
+    extra_output_args: Optional[list[str]] = None,
+) -> tuple[list[str], str]:
+    """Build the ffmpeg command for a watermark job without running it.
+
+    Returns `(cmd, out_path)`. Probing the video and preparing the cached
+    scaled logo happen here, so the returned command can be handed to any
+    runner (`add_watermark` below, or the asyncio engine in `ffengine`).
+
+    - `start` / `end` (seconds) limit the logo to that time window; the whole
+      file is still re-encoded (see `build_render_plan` for smart rendering).
+    - `out_path` overrides the generated output name.
+    - `extra_output_args` are inserted just before the output path.
     """
     ffmpeg = _which("ffmpeg")
     if not ffmpeg:
         raise RuntimeError("ffmpeg binary not found; please install ffmpeg.")
+    validate_window(start, end)
 
     # Ensure output dir exists
-    out_path = get_output_filepath(video_filepath, output_dir)
+    if out_path is None:
+        out_path = get_output_filepath(video_filepath, output_dir)
 
     # Probe video height to compute logo scale
     try:
@@ -74,8 +156,8 @@ def add_watermark(video_filepath: str, logo_filepath: str, output_dir: Optional[
     logo_h = max(1, int(v_height * float(scale)))
 
     # Build overlay position expression
-    padding_x = 15
-    padding_y = 55  # leave extra space for controls at bottom
+    padding_x = PADDING_X
+    padding_y = PADDING_Y
     if position == "top-left":
         overlay = f"{padding_x}:{padding_y}"
     elif position == "top-right":
@@ -121,6 +203,9 @@ def add_watermark(video_filepath: str, logo_filepath: str, output_dir: Optional[
         filter_parts.append(f"[1:v]scale=1080:1920[logo]")
     else:
         filter_parts.append(f"[1:v]scale=-1:{logo_h}[logo]")
+    enable = _enable_expr(start, end)
+    if enable:
+        overlay += f":enable='{enable}'"
     filter_parts.append(f"[v][logo]overlay={overlay}[outv]")
 
     filter_complex = ";".join(filter_parts)
@@ -161,23 +246,258 @@ def add_watermark(video_filepath: str, logo_filepath: str, output_dir: Optional[
         *threads_arg,
         "-c:a",
         "copy",
+        *(extra_output_args or []),
         str(out_path),
     ]
+    return cmd, out_path
+
+
+@dataclass
+class RenderPlan:
+    """ffmpeg commands to run in order to produce `out_path`.
+
+    `encode_step` is the index of the re-encoding command and
+    `encode_duration` the length in seconds of what it encodes (for progress).
+    `work_dir` holds intermediate segments and is removed by `cleanup`.
+    `smart` marks a partial re-encode, which runners retry as a full
+    re-encode if any of its steps fails.
+    """
+    steps: list[list[str]]
+    out_path: str
+    encode_step: int = 0
+    encode_duration: Optional[float] = None
+    work_dir: Optional[str] = None
+    smart: bool = False
+
+    def cleanup(self) -> None:
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def _ffprobe_video_stream(path: str) -> dict:
+    """Return codec/geometry fields of the first video stream, raise RuntimeError if it fails."""
+    ffprobe = _which("ffprobe")
+    if not ffprobe:
+        raise RuntimeError("ffprobe binary not found; please install ffmpeg package.")
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_name,profile,level,width,height,pix_fmt,time_base,sample_aspect_ratio", "-of", "json", path]
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {res.stderr.strip()}")
+    streams = json.loads(res.stdout or "{}").get("streams") or []
+    if not streams:
+        raise RuntimeError(f"No video stream in {path}")
+    return streams[0]
+
+
+def _ffprobe_keyframes(path: str) -> list[float]:
+    """Return sorted keyframe timestamps of the first video stream (packet scan, no decoding)."""
+    ffprobe = _which("ffprobe")
+    if not ffprobe:
+        raise RuntimeError("ffprobe binary not found; please install ffmpeg package.")
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {res.stderr.strip()}")
+    times = []
+    for line in res.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts))
+            except ValueError:
+                continue
+    return sorted(times)
+
+
+# ffprobe H.264 profile names -> libx264 `-profile:v` values (8-bit 4:2:0 only)
+_X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+
+def _smart_render_plan(video_filepath: str, logo_filepath: str, output_dir: Optional[str], position: str, scale: float, start: Optional[float], end: Optional[float]) -> Optional[RenderPlan]:
+    """Plan a partial re-encode of only the GOPs overlapping [start, end].
+
+    The source is split at the keyframes around the window with stream copy,
+    the middle part is re-encoded with the logo, and the parts are joined
+    with the concat demuxer; audio is copied once from the original.
+
+    Intermediates are MPEG-TS so each part carries its own H.264 parameter
+    sets in-band: with MP4 parts only the first part's `avcC` would survive
+    the concat and the re-encoded window would be decoded with the source's
+    SPS/PPS. The window is encoded with the source's profile and level and
+    the output is tagged `avc3` (parameter sets in-band), so the sample
+    description stays true for every part. A last step decodes the window
+    and both joins with `-xerror` so a broken splice fails the plan instead
+    of shipping.
+
+    Returns None when the source can't be stream-copied into our output
+    (anything other than 1080x1920 yuv420p H.264 in a profile libx264 can
+    match, since the regular path crops to that), or when the window needs
+    the whole file re-encoded.
+    """
+    ffmpeg = _which("ffmpeg")
+    if not ffmpeg:
+        return None
+    try:
+        info = _ffprobe_video_stream(video_filepath)
+        keyframes = _ffprobe_keyframes(video_filepath)
+    except RuntimeError:
+        return None
+    duration = _ffprobe_duration(video_filepath)
+    if (
+        not duration
+        or not keyframes
+        or info.get("codec_name") != "h264"
+        or info.get("profile") not in _X264_PROFILES
+        or (info.get("width"), info.get("height")) != (1080, 1920)
+        or info.get("pix_fmt") != "yuv420p"
+        or info.get("sample_aspect_ratio", "1:1") not in ("1:1", "0:1", "N/A")
+    ):
+        return None
+
+    win_start = start or 0.0
+    win_end = min(end, duration) if end is not None else duration
+    if win_start >= duration:
+        return None
+    eps = 0.001
+    k0 = max((k for k in keyframes if k <= win_start + eps), default=0.0)
+    k1 = min((k for k in keyframes if k >= win_end - eps), default=duration)
+    if k0 <= 0 and k1 >= duration:
+        return None
+
+    out_path = get_output_filepath(video_filepath, output_dir)
+    work_dir = Path(tempfile.mkdtemp(prefix="smart_", dir=Path(out_path).parent))
+
+    # The segment muxer cuts at the first keyframe at/after each time, i.e. exactly at k0/k1
+    cuts = []
+    if k0 > 0:
+        cuts.append(k0)
+    if k1 < duration:
+        cuts.append(k1)
+    split_cmd = [
+        ffmpeg, "-y", "-i", str(video_filepath),
+        "-map", "0:v:0", "-c", "copy", "-bsf:v", "h264_mp4toannexb",
+        "-f", "segment", "-segment_times", ",".join(f"{max(0.0, c - eps):.6f}" for c in cuts),
+        "-segment_format", "mpegts", "-reset_timestamps", "1",
+        str(work_dir / "seg_%03d.ts"),
+    ]
+
+    mid = 1 if k0 > 0 else 0
+    encode_args = ["-profile:v", _X264_PROFILES[info["profile"]]]
+    level = info.get("level")
+    if isinstance(level, int) and level > 0:
+        encode_args += ["-level:v", f"{level / 10:.1f}"]
+    # libx264 writes its SPS/PPS in-band when muxing to TS (no global header)
+    window_path = work_dir / "window.ts"
+    # The segment doesn't exist yet, so the height probe falls back to 1920 (the only eligible height)
+    encode_cmd, _ = build_watermark_command(
+        str(work_dir / f"seg_{mid:03d}.ts"),
+        logo_filepath,
+        position=position,
+        scale=scale,
+        start=max(0.0, win_start - k0) if start is not None else None,
+        end=win_end - k0 if end is not None else None,
+        out_path=str(window_path),
+        extra_output_args=["-pix_fmt", "yuv420p", *encode_args],
+    )
+
+    parts = [window_path.name]
+    if k0 > 0:
+        parts.insert(0, "seg_000.ts")
+    if k1 < duration:
+        parts.append(f"seg_{mid + 1:03d}.ts")
+    concat_list = work_dir / "concat.txt"
+    concat_list.write_text("".join(f"file '{name}'\n" for name in parts), encoding="utf-8")
+    concat_cmd = [
+        ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", str(concat_list),
+        "-i", str(video_filepath),
+        "-map", "0:v", "-map", "1:a?", "-c", "copy",
+        # avc3: parameter sets are in-band, so players use each part's own SPS/PPS
+        "-tag:v", "avc3",
+        str(out_path),
+    ]
+    verify_cmd = [
+        ffmpeg, "-v", "error", "-xerror",
+        "-ss", f"{max(0.0, k0 - 1.0):.6f}", "-i", str(out_path),
+        "-t", f"{k1 - k0 + 2.0:.6f}", "-map", "0:v", "-f", "null", "-",
+    ]
+    return RenderPlan(
+        [split_cmd, encode_cmd, concat_cmd, verify_cmd],
+        out_path,
+        encode_step=1,
+        encode_duration=k1 - k0,
+        work_dir=str(work_dir),
+        smart=True,
+    )
+
+
+def build_render_plan(
+    video_filepath: str,
+    logo_filepath: str,
+    output_dir: Optional[str] = None,
+    position: str = "bottom-right",
+    scale: float = 0.2,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    smart: bool = False,
+) -> RenderPlan:
+    """Plan a watermark job as one or more ffmpeg commands.
+
+    With `smart=True` and a time window, only the GOPs overlapping the window
+    are re-encoded and the rest is stream-copied; if the source doesn't allow
+    that, this falls back to a single full re-encode.
+    """
+    validate_window(start, end)
+    if smart and (start is not None or end is not None):
+        plan = _smart_render_plan(video_filepath, logo_filepath, output_dir, position, scale, start, end)
+        if plan is not None:
+            return plan
+    cmd, out_path = build_watermark_command(video_filepath, logo_filepath, output_dir, position=position, scale=scale, start=start, end=end)
+    return RenderPlan([cmd], out_path, encode_duration=_ffprobe_duration(video_filepath))
+
+
+def add_watermark(
+    video_filepath: str,
+    logo_filepath: str,
+    output_dir: Optional[str] = None,
+    position: str = "bottom-right",
+    scale: float = 0.2,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    smart: bool = False,
+) -> str:
+    """Add watermark using ffmpeg and return the output filepath.
+
+    - `scale` is relative to video height (e.g. 0.2 means logo height = 20% of video height).
+    - `position` one of top-left, top-right, bottom-left, bottom-right, full.
+    - `start` / `end` (seconds) show the logo only in that window.
+    - `smart` re-encodes only the GOPs overlapping the window when possible.
+    """
+    plan = build_render_plan(video_filepath, logo_filepath, output_dir, position=position, scale=scale, start=start, end=end, smart=smart)
+    try:
+        _run_plan(plan)
+    except RuntimeError as e:
+        if not plan.smart:
+            raise
+        # partial re-encode failed (or didn't verify): redo the whole file
+        logger.warning("smart render failed, falling back to a full re-encode: %s", e)
+        plan = build_render_plan(video_filepath, logo_filepath, output_dir, position=position, scale=scale, start=start, end=end)
+        _run_plan(plan)
+    return plan.out_path
+
 
+def _run_plan(plan: RenderPlan) -> None:
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        # include stderr for diagnostics and write to storage/errors.log
-        err = e.stderr.decode(errors="ignore") if e.stderr else str(e)
-        try:
-            errfile = Path(os.environ.get("STORAGE_DIR", "storage")) / "errors.log"
-            errfile.parent.mkdir(parents=True, exist_ok=True)
-            with errfile.open("a", encoding="utf-8") as f:
-                f.write("--- ffmpeg error ---\n")
-                f.write(f"cmd: {shlex.join(cmd)}\n")
-                f.write(err + "\n")
-        except Exception:
-            pass
-        raise RuntimeError(f"ffmpeg failed: {err}") from e
-
-    return out_path
\ No newline at end of file
+        for cmd in plan.steps:
+            try:
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except subprocess.CalledProcessError as e:
+                # include stderr for diagnostics and write to storage/errors.log
+                err = e.stderr.decode(errors="ignore") if e.stderr else str(e)
+                log_ffmpeg_error(cmd, err)
+                raise RuntimeError(f"ffmpeg failed: {err}") from e
+    except BaseException:
+        # don't leave a truncated output behind
+        Path(plan.out_path).unlink(missing_ok=True)
+        raise
+    finally:
+        plan.cleanup()
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""Load test for the FastAPI backend.
+
+Starts the app locally in a child process with a stub encoder (sleeps for
+`--encode-seconds`, then copies the input as the output) and drives
+concurrent uploaders, pollers and downloaders against it. Reports latency
+percentiles per endpoint, error rates and upload-to-completion time, and
+writes the results to JSON so runs can be compared.
+
+Usage (from the repo root):
+
+    python scripts/loadtest_api.py --uploaders 8 --pollers 32 --downloaders 4 --duration 30
+
+Pass `--base-url` to target an already running backend instead; jobs then go
+through the real encoder, so `--video` must point at a real sample clip. Jobs
+on that backend are left alone unless `--reset` is given. Requires `httpx` in
+addition to the backend deps.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+# --- stub server -----------------------------------------------------------
+
+def serve_stub(port: int, encode_seconds: float, storage: str) -> None:
+    """Run the real app with `ffengine.add_watermark` replaced by a sleep."""
+    sys.path.insert(0, str(ROOT))
+    import uvicorn
+    import ffengine
+    import marker
+    from backend.app.core.config import settings
+    from backend.app.services import watermark
+    from backend.app.main import app
+
+    settings.storage_dir = storage
+    # keep the repo's processing.log out of it
+    watermark.LOG_FILE = Path(storage) / "processing.log"
+
+    async def add_watermark(video_filepath, logo_filepath, output_dir=None, *args, on_progress=None, **kwargs):
+        steps = 4
+        for i in range(steps):
+            await asyncio.sleep(encode_seconds / steps)
+            if on_progress is not None:
+                on_progress((i + 1) * 100 // steps)
+        out_path = marker.get_output_filepath(video_filepath, output_dir)
+        shutil.copyfile(video_filepath, out_path)
+        return out_path
+
+    ffengine.add_watermark = add_watermark
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- load generation -------------------------------------------------------
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.uploaded_at: dict[str, float] = {}
+        self.completed_at: dict[str, float] = {}
+        self.failed_jobs: set[str] = set()
+        self.downloaded: set[str] = set()
+
+    async def timed(self, name: str, request):
+        start = time.perf_counter()
+        try:
+            resp = await request
+        except Exception:
+            self.errors[name] += 1
+            self.latencies[name].append(time.perf_counter() - start)
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return resp
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    # nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def _summary(values: list[float], scale: float = 1.0) -> dict:
+    v = sorted(x * scale for x in values)
+    if not v:
+        return {"count": 0}
+    return {
+        "count": len(v),
+        "mean": sum(v) / len(v),
+        "p50": _percentile(v, 50),
+        "p90": _percentile(v, 90),
+        "p95": _percentile(v, 95),
+        "p99": _percentile(v, 99),
+        "max": v[-1],
+    }
+
+
+async def uploader(client, stats: Stats, stop: float, args, video_bytes: bytes, logo_bytes: bytes, worker: int) -> None:
+    n = 0
+    while time.monotonic() < stop:
+        files = [("videos", (f"lt_{worker}_{n}_{i}.mp4", video_bytes, "video/mp4")) for i in range(args.batch_size)]
+        files.append(("logo", (f"lt_logo_{worker}.png", logo_bytes, "image/png")))
+        n += 1
+        sent = time.monotonic()
+        resp = await stats.timed("POST /api/jobs/upload", client.post("/api/jobs/upload", files=files))
+        if resp is not None:
+            for job in resp.json():
+                stats.uploaded_at[job["id"]] = sent
+        await asyncio.sleep(args.upload_interval)
+
+
+async def poller(client, stats: Stats, stop_event: asyncio.Event, args) -> None:
+    while not stop_event.is_set():
+        resp = await stats.timed("GET /api/jobs", client.get("/api/jobs"))
+        if resp is not None:
+            now = time.monotonic()
+            for job in resp.json():
+                if job["status"] == "completed":
+                    stats.completed_at.setdefault(job["id"], now)
+                elif job["status"] == "failed":
+                    stats.failed_jobs.add(job["id"])
+        await asyncio.sleep(args.poll_interval)
+
+
+async def downloader(client, stats: Stats, stop_event: asyncio.Event, args) -> None:
+    while not stop_event.is_set():
+        pending = [job_id for job_id in stats.completed_at if job_id not in stats.downloaded]
+        if not pending:
+            await asyncio.sleep(args.poll_interval)
+            continue
+        job_id = pending[0]
+        stats.downloaded.add(job_id)
+        await stats.timed("GET /api/jobs/{id}/download", client.get(f"/api/jobs/{job_id}/download"))
+
+
+async def run_load(base_url: str, args, reset: bool) -> dict:
+    import httpx
+
+    # the stub encoder never reads the bytes, so random data is enough there
+    video_bytes = Path(args.video).read_bytes() if args.video else os.urandom(args.video_kb * 1024)
+    logo_bytes = (ROOT / "storage" / "logos" / "ainews.png").read_bytes()
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.uploaders + args.pollers + args.downloaders + 4)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        if reset:
+            await client.post("/api/jobs/reset")
+        started = time.monotonic()
+        upload_stop = started + args.duration
+        stop_event = asyncio.Event()
+        background = [asyncio.create_task(poller(client, stats, stop_event, args)) for _ in range(args.pollers)]
+        background += [asyncio.create_task(downloader(client, stats, stop_event, args)) for _ in range(args.downloaders)]
+
+        await asyncio.gather(*(
+            uploader(client, stats, upload_stop, args, video_bytes, logo_bytes, i) for i in range(args.uploaders)
+        ))
+        # keep polling until every uploaded job finished or the drain window ends
+        drain_stop = time.monotonic() + args.drain
+        while time.monotonic() < drain_stop:
+            done = set(stats.completed_at) | stats.failed_jobs
+            if args.pollers == 0 or done >= set(stats.uploaded_at):
+                break
+            await asyncio.sleep(0.2)
+        stop_event.set()
+        await asyncio.gather(*background)
+        elapsed = time.monotonic() - started
+
+    completion = [stats.completed_at[j] - t for j, t in stats.uploaded_at.items() if j in stats.completed_at]
+    endpoints = {}
+    for name, values in sorted(stats.latencies.items()):
+        endpoints[name] = {
+            "latency_ms": _summary(values, scale=1000.0),
+            "errors": stats.errors[name],
+            "error_rate": stats.errors[name] / len(values) if values else 0.0,
+            "rps": len(values) / elapsed if elapsed else 0.0,
+        }
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "serve_stub"},
+        "base_url": base_url,
+        "elapsed_s": elapsed,
+        "endpoints": endpoints,
+        "jobs": {
+            "uploaded": len(stats.uploaded_at),
+            "completed": len(completion),
+            "failed": len(stats.failed_jobs),
+            "unfinished": len(set(stats.uploaded_at) - set(stats.completed_at) - stats.failed_jobs),
+            "upload_to_completion_s": _summary(completion),
+        },
+    }
+
+
+def _print_report(result: dict) -> None:
+    print(f"elapsed: {result['elapsed_s']:.1f}s  against {result['base_url']}")
+    print(f"{'endpoint':<32}{'count':>7}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, ep in result["endpoints"].items():
+        lat = ep["latency_ms"]
+        print(f"{name:<32}{lat['count']:>7}{ep['error_rate'] * 100:>6.1f}%{lat.get('p50', 0):>9.1f}{lat.get('p95', 0):>9.1f}{lat.get('p99', 0):>9.1f}{lat.get('max', 0):>9.1f}")
+    jobs = result["jobs"]
+    comp = jobs["upload_to_completion_s"]
+    print(f"jobs: uploaded={jobs['uploaded']} completed={jobs['completed']} failed={jobs['failed']} unfinished={jobs['unfinished']}")
+    if comp["count"]:
+        print(f"upload->completion: p50={comp['p50']:.2f}s p95={comp['p95']:.2f}s max={comp['max']:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the Automark API")
+    parser.add_argument("--base-url", help="target an already running backend instead of starting a stub one")
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--pollers", type=int, default=16)
+    parser.add_argument("--downloaders", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to keep uploading")
+    parser.add_argument("--drain", type=float, default=30.0, help="max seconds to wait for jobs after uploads stop")
+    parser.add_argument("--batch-size", type=int, default=3, help="videos per upload request")
+    parser.add_argument("--video", help="sample video to upload (required with --base-url)")
+    parser.add_argument("--video-kb", type=int, default=512, help="size of each fake video when --video is not given")
+    parser.add_argument("--reset", action="store_true", help="clear all jobs on --base-url before the run")
+    parser.add_argument("--upload-interval", type=float, default=1.0)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--encode-seconds", type=float, default=2.0, help="stub encoder time per job")
+    parser.add_argument("--out", help="JSON results path (default storage/loadtest/loadtest_<timestamp>.json)")
+    parser.add_argument("--serve-stub", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--storage", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.base_url and not args.video and not args.serve_stub:
+        parser.error("--video is required with --base-url (random bytes would fail in the real encoder)")
+
+    if args.serve_stub:
+        serve_stub(args.port, args.encode_seconds, args.storage)
+        return
+
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("httpx is required: pip install httpx")
+
+    server = None
+    storage = None
+    base_url = args.base_url
+    if not base_url:
+        port = _free_port()
+        storage = tempfile.mkdtemp(prefix="automark_loadtest_")
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--serve-stub", "--port", str(port), "--encode-seconds", str(args.encode_seconds), "--storage", storage],
+            cwd=str(ROOT),
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if server.poll() is not None or time.monotonic() > deadline:
+                sys.exit("stub server failed to start")
+            time.sleep(0.2)
+
+    try:
+        # the stub server is ours to reset; a live backend only with --reset
+        result = asyncio.run(run_load(base_url, args, reset=server is not None or args.reset))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if storage is not None:
+            shutil.rmtree(storage, ignore_errors=True)
+
+    out = Path(args.out) if args.out else ROOT / "storage" / "loadtest" / f"loadtest_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    _print_report(result)
+    print(f"results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
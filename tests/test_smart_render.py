@@ -0,0 +1,109 @@
+from pathlib import Path
+import json
+import logging
+import shutil
+import subprocess
+
+import pytest
+
+import marker
+
+ROOT = Path(__file__).resolve().parents[1]
+LOGO = ROOT / "storage" / "logos" / "ainews.png"
+
+needs_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+    reason="ffmpeg and ffprobe are required",
+)
+
+
+@pytest.fixture
+def ts_demuxer(tmp_path):
+    """Skip unless this ffmpeg build can read back the MPEG-TS intermediates."""
+    probe = tmp_path / "probe.ts"
+    make = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc2=size=64x64:rate=10", "-t", "1", "-c:v", "libx264", "-f", "mpegts", str(probe)],
+        capture_output=True,
+    )
+    read = subprocess.run(["ffmpeg", "-v", "error", "-i", str(probe), "-f", "null", "-"], capture_output=True)
+    if make.returncode != 0 or read.returncode != 0:
+        pytest.skip(f"this ffmpeg build can't demux MPEG-TS (exit {read.returncode})")
+
+
+def _make_clip(path: Path, seconds: int = 8) -> None:
+    # ultrafast gives Constrained Baseline, unlike libx264's default High
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", "testsrc2=size=1080x1920:rate=30",
+            "-f", "lavfi", "-i", "sine=frequency=440",
+            "-t", str(seconds),
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest",
+            str(path),
+        ],
+        check=True,
+    )
+
+
+def _frame_count(path: str) -> int:
+    res = subprocess.run(
+        ["ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0", "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    )
+    return int(res.stdout.strip())
+
+
+def _video_stream(path: str) -> dict:
+    res = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=profile,codec_tag_string", "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(res.stdout)["streams"][0]
+
+
+@needs_ffmpeg
+def test_smart_render_plan_steps_succeed(tmp_path, monkeypatch, ts_demuxer):
+    monkeypatch.setenv("STORAGE_DIR", str(tmp_path / "storage"))
+    clip = tmp_path / "clip.mp4"
+    _make_clip(clip)
+
+    plan = marker.build_render_plan(str(clip), str(LOGO), str(tmp_path / "out"), start=3, end=5, smart=True)
+    try:
+        assert plan.smart
+        assert len(plan.steps) == 4
+        # run the steps ourselves: add_watermark would hide a failure behind the fallback
+        for cmd in plan.steps:
+            res = subprocess.run(cmd, capture_output=True, text=True)
+            assert res.returncode == 0, res.stderr
+    finally:
+        plan.cleanup()
+
+    res = subprocess.run(["ffmpeg", "-v", "error", "-i", plan.out_path, "-f", "null", "-"], capture_output=True, text=True)
+    assert res.returncode == 0
+    assert res.stderr == ""
+    assert _frame_count(plan.out_path) == _frame_count(str(clip))
+    stream = _video_stream(plan.out_path)
+    assert stream["codec_tag_string"] == "avc3"
+    assert stream["profile"] == _video_stream(str(clip))["profile"]
+
+
+@needs_ffmpeg
+def test_smart_render_does_not_fall_back(tmp_path, monkeypatch, caplog, ts_demuxer):
+    monkeypatch.setenv("STORAGE_DIR", str(tmp_path / "storage"))
+    clip = tmp_path / "clip.mp4"
+    _make_clip(clip)
+    out_dir = tmp_path / "out"
+
+    with caplog.at_level(logging.WARNING, logger="marker"):
+        out = marker.add_watermark(str(clip), str(LOGO), str(out_dir), start=3, end=5, smart=True)
+
+    assert "falling back" not in caplog.text
+    assert _video_stream(out)["codec_tag_string"] == "avc3"
+    assert not list(out_dir.glob("smart_*"))
+
+
+@pytest.mark.parametrize("start,end", [(-1, None), (None, 0), (5, 5), (5, 3)])
+def test_validate_window_rejects_bad_windows(start, end):
+    with pytest.raises(ValueError):
+        marker.validate_window(start, end)